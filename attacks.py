@@ -2,9 +2,23 @@
 
 import os
 import io
+import math
 import argparse
+import functools
+import itertools
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
 from PIL import Image, ImageFilter, ImageEnhance, ImageOps
 import numpy as np
+import cv2
+
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB, TJSAMP_420
+    _tj = TurboJPEG()
+except (ImportError, OSError, RuntimeError):  # PyTurboJPEG or libturbojpeg not available
+    _tj = None
+
+rng = np.random.default_rng()
 
 # ==============================================================================
 # ==                           ATTACK IMPLEMENTATIONS                         ==
@@ -13,6 +27,11 @@ import numpy as np
 
 def apply_jpeg_compression(image: Image.Image, quality: int) -> Image.Image:
     """Simulates JPEG compression by saving and reloading the image in memory."""
+    if _tj is not None:
+        # libjpeg-turbo round trip on the raw pixel buffer, same 4:2:0 subsampling as PIL
+        arr = np.ascontiguousarray(np.asarray(image.convert("RGB")))
+        jpeg_bytes = _tj.encode(arr, quality=quality, pixel_format=TJPF_RGB, jpeg_subsample=TJSAMP_420)
+        return Image.fromarray(_tj.decode(jpeg_bytes, pixel_format=TJPF_RGB))
     buffer = io.BytesIO()
     # Convert to RGB before saving as JPEG to avoid issues with alpha channels
     image.convert("RGB").save(buffer, format="JPEG", quality=quality)
@@ -21,10 +40,14 @@ def apply_jpeg_compression(image: Image.Image, quality: int) -> Image.Image:
 
 def apply_gaussian_noise(image: Image.Image, std_dev: float) -> Image.Image:
     """Adds Gaussian noise to the image."""
-    img_array = np.array(image).astype(np.float32)
-    noise = np.random.normal(0, std_dev, img_array.shape)
-    noisy_array = np.clip(img_array + noise, 0, 255).astype(np.uint8)
-    return Image.fromarray(noisy_array)
+    img_array = np.asarray(image, dtype=np.uint8)
+    # Work in a single float32 buffer: noise, add and clip all happen in place
+    buf = np.empty(img_array.shape, dtype=np.float32)
+    rng.standard_normal(dtype=np.float32, out=buf)
+    buf *= std_dev
+    buf += img_array
+    np.clip(buf, 0, 255, out=buf)
+    return Image.fromarray(buf.astype(np.uint8))
 
 def apply_blur(image: Image.Image, radius: float) -> Image.Image:
     """Applies a Gaussian blur filter."""
@@ -40,16 +63,48 @@ def apply_contrast(image: Image.Image, factor: float) -> Image.Image:
     enhancer = ImageEnhance.Contrast(image)
     return enhancer.enhance(factor)
 
+@functools.lru_cache(maxsize=32)
+def _gamma_lut(gamma: float) -> bytes:
+    """Builds the 256-entry gamma lookup table for a single band."""
+    lut = (np.arange(256) / 255.0) ** (1.0 / gamma) * 255.0
+    return np.clip(lut, 0, 255).astype(np.uint8).tobytes()
+
 def apply_gamma_correction(image: Image.Image, gamma: float) -> Image.Image:
     """Applies gamma correction."""
     if gamma <= 0: return image
-    inv_gamma = 1.0 / gamma
-    lut = [int(((i / 255.0) ** inv_gamma) * 255) for i in range(256)]
-    return image.point(lut * len(image.getbands()))
+    return image.point(_gamma_lut(gamma) * len(image.getbands()))
+
+def _translation(tx: float, ty: float) -> np.ndarray:
+    return np.array([[1.0, 0.0, tx], [0.0, 1.0, ty], [0.0, 0.0, 1.0]])
+
+@functools.lru_cache(maxsize=32)
+def _outside_mask(coefficients, input_size, size) -> np.ndarray:
+    """Marks the output pixels whose sample point falls outside the input, which PIL
+    fills with black. Depends only on the geometry, so it is shared across images."""
+    a, b, c, d, e, f = coefficients
+    xs = np.arange(size[0]) + 0.5
+    ys = np.arange(size[1])[:, None] + 0.5
+    src_x = a * xs + b * ys + c
+    src_y = d * xs + e * ys + f
+    mask = (src_x < 0) | (src_x >= input_size[0]) | (src_y < 0) | (src_y >= input_size[1])
+    mask.flags.writeable = False
+    return mask
+
+def _warp_affine(image: Image.Image, matrix: np.ndarray, size) -> Image.Image:
+    """Resamples the image with an output-to-input affine map, filling with black."""
+    # OpenCV puts pixel centers at integer coordinates, PIL at +0.5
+    cv_matrix = _translation(-0.5, -0.5) @ matrix @ _translation(0.5, 0.5)
+    warped = cv2.warpAffine(np.asarray(image), cv_matrix[:2], size, flags=cv2.INTER_CUBIC | cv2.WARP_INVERSE_MAP,
+                            borderMode=cv2.BORDER_REPLICATE)
+    # Replicate rather than blend the border into the outermost pixels, then black
+    # out what lies outside the input like PIL does
+    warped[_outside_mask(tuple(matrix[:2].flatten()), image.size, tuple(size))] = 0
+    return Image.fromarray(warped)
 
 def apply_rotation(image: Image.Image, angle: int) -> Image.Image:
     """Applies rotation to an image, expanding the frame to fit."""
-    return image.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor='black')
+    matrix, size = _affine_matrix(image.size, (("rotation", angle),))
+    return _warp_affine(image, matrix, size)
 
 def apply_center_crop(image: Image.Image, scale_factor: float) -> Image.Image:
     """Applies a center crop to an image, keeping a specified fraction."""
@@ -59,26 +114,353 @@ def apply_center_crop(image: Image.Image, scale_factor: float) -> Image.Image:
     left, top = (ow - nw) / 2, (oh - nh) / 2
     return image.crop((left, top, left + nw, top + nh))
 
+def _resize(arr: np.ndarray, size) -> np.ndarray:
+    # Area averaging when shrinking, bicubic when enlarging
+    shrinking = size[0] * size[1] < arr.shape[1] * arr.shape[0]
+    return cv2.resize(arr, size, interpolation=cv2.INTER_AREA if shrinking else cv2.INTER_CUBIC)
+
+def _scale_down_up(image: Image.Image, new_size, original_size) -> Image.Image:
+    # Area averaging drops more high-frequency detail than PIL's bicubic resize did, so
+    # results on noisy content are not comparable with runs from before the switch
+    factor = image.width // new_size[0] if new_size[0] else 0
+    if factor > 1 and image.size == (new_size[0] * factor, new_size[1] * factor):
+        # Exact integer ratio: box-average with Image.reduce instead of a general resample
+        downscaled = np.asarray(image.reduce(factor))
+    else:
+        downscaled = _resize(np.asarray(image), new_size)
+    return Image.fromarray(_resize(downscaled, original_size))
+
 def apply_scaling(image: Image.Image, scale_factor: float) -> Image.Image:
     """Scales an image down and then back up."""
     original_size = image.size
     new_size = (int(original_size[0] * scale_factor), int(original_size[1] * scale_factor))
-    downscaled_img = image.resize(new_size, Image.Resampling.BICUBIC)
-    return downscaled_img.resize(original_size, Image.Resampling.BICUBIC)
+    return _scale_down_up(image, new_size, original_size)
 
 def apply_shear(image: Image.Image, angle: int) -> Image.Image:
     """Applies a shear transformation."""
-    return image.transform(image.size, Image.AFFINE, (1, angle / 100, 0, 0, 1, 0))
+    return image.transform(image.size, Image.AFFINE, (1, angle / 100, 0, 0, 1, 0),
+                           resample=Image.BICUBIC, fillcolor=(0, 0, 0))
 
 def apply_flip(image: Image.Image, _: bool) -> Image.Image: # Add dummy arg to match structure
     """Applies a horizontal flip."""
     return ImageOps.mirror(image)
 
 
+# ==============================================================================
+# ==                           ATTACK CHAIN FUSION                            ==
+# ==============================================================================
+
+_LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114])
+
+def _tone_lut(steps, histogram=None) -> bytes:
+    """Composes brightness/contrast/gamma steps into a single-band lookup table.
+
+    Each step truncates and saturates to uint8 like the unfused attacks do. Contrast
+    steps pivot on the mean luminance of the image as it stands after the preceding
+    steps, estimated from `histogram` (Image.histogram() of the input) mapped through
+    the table so far. This approximates ImageEnhance.Contrast, which averages the
+    per-pixel rounded L image instead of weighting the per-band means.
+    """
+    lut = np.arange(256, dtype=np.float32)
+    for name, value in steps:
+        if name == "brightness":
+            lut = lut * value
+        elif name == "contrast":
+            counts = np.asarray(histogram, dtype=np.float64).reshape(-1, 256)
+            band_means = counts @ lut / counts.sum(axis=1)
+            mean = band_means @ _LUMA_WEIGHTS if len(band_means) == 3 else band_means[0]
+            pivot = int(mean + 0.5)
+            lut = (lut - pivot) * value + pivot
+        elif name == "gamma" and value > 0:
+            lut = (lut / 255.0) ** (1.0 / value) * 255.0
+        lut = np.floor(np.clip(lut, 0, 255))
+    return lut.astype(np.uint8).tobytes()
+
+def apply_tone_curve(image: Image.Image, steps) -> Image.Image:
+    """Applies a run of brightness/contrast/gamma steps as one lookup-table pass."""
+    histogram = None
+    if any(name == "contrast" for name, _ in steps):
+        histogram = image.histogram()
+    return image.point(_tone_lut(steps, histogram) * len(image.getbands()))
+
+_TONE_ATTACKS = {apply_brightness: "brightness", apply_contrast: "contrast", apply_gamma_correction: "gamma"}
+
+@functools.lru_cache(maxsize=32)
+def _affine_matrix(size, steps):
+    """Composes rotation/shear/flip steps into one affine map.
+
+    The 3x3 matrix maps output coordinates to input coordinates in PIL's continuous
+    pixel space (as expected by Image.AFFINE) and mirrors the geometry of the
+    corresponding apply_* functions. Returns the matrix and the output size.
+    """
+    matrix = np.eye(3)
+    for name, value in steps:
+        w, h = size
+        step = np.eye(3)
+        if name == "rotation" and value % 360 != 0:
+            # Same matrix and expanded frame as Image.rotate(expand=True)
+            theta = -math.radians(value)
+            cos, sin = round(math.cos(theta), 15), round(math.sin(theta), 15)
+            rotation = np.array([[cos, sin, 0.0], [-sin, cos, 0.0], [0.0, 0.0, 1.0]])
+            step = _translation(w / 2, h / 2) @ rotation @ _translation(-w / 2, -h / 2)
+            if value % 90 == 0:
+                # Image.rotate transposes these exactly
+                nw, nh = (h, w) if value % 180 else (w, h)
+            else:
+                corners = step @ np.array([[0, w, w, 0], [0, 0, h, h], [1, 1, 1, 1]])
+                nw = math.ceil(corners[0].max()) - math.floor(corners[0].min())
+                nh = math.ceil(corners[1].max()) - math.floor(corners[1].min())
+            step = step @ _translation(-(nw - w) / 2, -(nh - h) / 2)
+            size = (nw, nh)
+        elif name == "shear":
+            step = np.array([[1.0, value / 100, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]])
+        elif name == "flip":
+            step = np.array([[-1.0, 0.0, w], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]])
+        matrix = matrix @ step
+    return matrix, size
+
+def apply_affine(image: Image.Image, steps) -> Image.Image:
+    """Applies a run of geometric steps as a single bicubic resample."""
+    matrix, size = _affine_matrix(image.size, steps)
+    return _warp_affine(image, matrix, size)
+
+_GEOMETRIC_ATTACKS = {apply_rotation: "rotation", apply_shear: "shear", apply_flip: "flip"}
+
+def _fuse_steps(attack_chain, names, fused_func):
+    """Replaces each contiguous run of two or more attacks listed in `names` with a single
+    `(fused_func, ((name, strength), ...))` step. Other steps are kept as they are."""
+    fused = []
+    for fusable, group in itertools.groupby(attack_chain, key=lambda step: step[0] in names):
+        group = list(group)
+        if fusable and len(group) > 1:
+            fused.append((fused_func, tuple((names[func], strength) for func, strength in group)))
+        else:
+            fused.extend(group)
+    return fused
+
+def apply_lut(image: Image.Image, lut: bytes) -> Image.Image:
+    """Applies a precomputed lookup table covering all bands of the image."""
+    return image.point(lut)
+
+def _compile_chain(attack_chain):
+    """Precomputes everything in the chain that depends only on the attack parameters,
+    so it is done once per folder rather than once per image. Assumes RGB images."""
+    compiled = []
+    for func, strength in attack_chain:
+        if func is apply_gamma_correction and strength > 0:
+            compiled.append((apply_lut, _gamma_lut(strength) * 3))
+        elif func is apply_tone_curve and all(name != "contrast" for name, _ in strength):
+            # Without a contrast step the composed table doesn't depend on the image
+            compiled.append((apply_lut, _tone_lut(strength) * 3))
+        else:
+            compiled.append((func, strength))
+    return tuple(compiled)
+
+@functools.lru_cache(maxsize=8)
+def _chain_runner(attack_chain):
+    """Generates a straight-line function applying each step of `attack_chain` in sequence,
+    so the per-image path has no loop or tuple unpacking. Built once per chain and process."""
+    namespace = {}
+    source = "def run(img):\n"
+    for i, (func, strength) in enumerate(attack_chain):
+        namespace[f"f{i}"], namespace[f"a{i}"] = func, strength
+        source += f"    img = f{i}(img, a{i})\n"
+    source += "    return img\n"
+    exec(compile(source, "<attack_chain>", "exec"), namespace)
+    return namespace["run"]
+
+
+# ==============================================================================
+# ==                       BATCHED TENSOR IMPLEMENTATIONS                     ==
+# ==============================================================================
+# Counterparts of the attacks above for a float (N, 3, H, W) batch in [0, 1]. Only
+# the --device path uses them, so torch and torchvision are imported lazily.
+
+def _tensor_affine(x: "torch.Tensor", steps) -> "torch.Tensor":
+    import torch
+    h, w = x.shape[-2:]
+    matrix, (nw, nh) = _affine_matrix((w, h), steps)
+    matrix = torch.as_tensor(matrix[:2], dtype=x.dtype, device=x.device)
+    # Sample at output pixel centers, normalized for align_corners=False
+    ys, xs = torch.meshgrid(torch.arange(nh, dtype=x.dtype, device=x.device) + 0.5,
+                            torch.arange(nw, dtype=x.dtype, device=x.device) + 0.5, indexing="ij")
+    src = torch.stack([xs, ys, torch.ones_like(xs)], dim=-1) @ matrix.T
+    grid = src / torch.tensor([w, h], dtype=x.dtype, device=x.device) * 2 - 1
+    warped = torch.nn.functional.grid_sample(x, grid.expand(len(x), -1, -1, -1), mode="bicubic",
+                                             padding_mode="border", align_corners=False)
+    # Like PIL, only samples falling outside the input are filled with black
+    outside = (src[..., 0] < 0) | (src[..., 0] >= w) | (src[..., 1] < 0) | (src[..., 1] >= h)
+    # Bicubic overshoots, clamp like PIL's uint8 saturation
+    return warped.masked_fill(outside, 0).clamp(0, 1)
+
+def _tensor_center_crop(x: "torch.Tensor", scale_factor: float) -> "torch.Tensor":
+    if not 0.0 < scale_factor <= 1.0: return x
+    oh, ow = x.shape[-2:]
+    nw, nh = int(ow * scale_factor), int(oh * scale_factor)
+    left, top = (ow - nw) / 2, (oh - nh) / 2
+    return x[..., round(top):round(top + nh), round(left):round(left + nw)]
+
+def _tensor_scaling(x: "torch.Tensor", scale_factor: float) -> "torch.Tensor":
+    import torchvision.transforms.functional as TF
+    from torchvision.transforms import InterpolationMode
+    original_size = list(x.shape[-2:])
+    new_size = [int(original_size[0] * scale_factor), int(original_size[1] * scale_factor)]
+    downscaled = TF.resize(x, new_size, interpolation=InterpolationMode.BICUBIC, antialias=True).clamp(0, 1)
+    return TF.resize(downscaled, original_size, interpolation=InterpolationMode.BICUBIC, antialias=True).clamp(0, 1)
+
+def _tensor_blur(x: "torch.Tensor", radius: float) -> "torch.Tensor":
+    import torchvision.transforms.functional as TF
+    if radius <= 0: return x
+    kernel_size = 2 * math.ceil(3 * radius) + 1
+    return TF.gaussian_blur(x, [kernel_size, kernel_size], [radius, radius])
+
+def _tensor_tone_curve(x: "torch.Tensor", steps) -> "torch.Tensor":
+    import torchvision.transforms.functional as TF
+    for name, value in steps:
+        if name == "brightness":
+            x = TF.adjust_brightness(x, value)
+        elif name == "contrast":
+            x = TF.adjust_contrast(x, value)
+        elif name == "gamma" and value > 0:
+            x = TF.adjust_gamma(x, 1.0 / value)
+    return x
+
+def _tensor_gaussian_noise(x: "torch.Tensor", std_dev: float) -> "torch.Tensor":
+    import torch
+    return (x + torch.randn_like(x) * (std_dev / 255.0)).clamp(0, 1)
+
+def _tensor_jpeg_compression(x: "torch.Tensor", quality: int) -> "torch.Tensor":
+    import torch
+    import torchvision.transforms.functional as TF
+    # No batched JPEG codec on device, so round-trip each image through the CPU
+    images = [apply_jpeg_compression(TF.to_pil_image(_to_uint8(t)), quality) for t in x]
+    return _to_float(torch.stack([TF.pil_to_tensor(img) for img in images]).to(x.device))
+
+def _to_float(x: "torch.Tensor") -> "torch.Tensor":
+    return x.float() / 255.0
+
+def _to_uint8(x: "torch.Tensor") -> "torch.Tensor":
+    import torch
+    return (x * 255.0).round().clamp(0, 255).to(torch.uint8).cpu()
+
+def _single_step(fused_func, name):
+    """Adapts a fused tensor op to an unfused (func, strength) chain step."""
+    return lambda x, strength: fused_func(x, ((name, strength),))
+
+_TENSOR_ATTACKS = {
+    apply_jpeg_compression: _tensor_jpeg_compression,
+    apply_gaussian_noise: _tensor_gaussian_noise,
+    apply_blur: _tensor_blur,
+    apply_center_crop: _tensor_center_crop,
+    apply_scaling: _tensor_scaling,
+    apply_tone_curve: _tensor_tone_curve,
+    apply_affine: _tensor_affine,
+    **{func: _single_step(_tensor_tone_curve, name) for func, name in _TONE_ATTACKS.items()},
+    **{func: _single_step(_tensor_affine, name) for func, name in _GEOMETRIC_ATTACKS.items()},
+}
+
+
 # ==============================================================================
 # ==                            MAIN SCRIPT LOGIC                             ==
 # ==============================================================================
 
+def _init_worker(num_workers: int):
+    """Reseeds the noise generator so forked workers don't share a random stream,
+    and splits OpenCV's threads between the workers to avoid oversubscription."""
+    global rng
+    rng = np.random.default_rng()
+    cv2.setNumThreads(max(1, os.cpu_count() // num_workers))
+
+def _save_result(attacked_img: Image.Image, filename: str, output_dir: str, quality: int, subsampling: int):
+    output_filename = os.path.splitext(filename)[0] + '.jpg'
+    output_path = os.path.join(output_dir, output_filename)
+    # Save final result at high quality by default; optimize/progressive only cost extra passes
+    attacked_img.save(output_path, "JPEG", quality=quality, subsampling=subsampling,
+                      optimize=False, progressive=False)
+
+def _process_one(filename, input_folder, attack_chain, output_dir, save_options, jpeg_draft=False):
+    """Applies the attack chain to a single image and saves the result.
+
+    Kept at module level so it can be pickled into worker processes.
+    """
+    try:
+        image_path = os.path.join(input_folder, filename)
+        with Image.open(image_path) as img:
+            if jpeg_draft and attack_chain and attack_chain[0][0] is apply_scaling and img.format == "JPEG":
+                # Let libjpeg decode at 1/2, 1/4 or 1/8 size straight from the DCT
+                # coefficients when the first attack discards most of that detail anyway.
+                # This is not the same as downscaling a full decode, so it is opt-in.
+                original_size = img.size
+                scale_factor = attack_chain[0][1]
+                new_size = (int(original_size[0] * scale_factor), int(original_size[1] * scale_factor))
+                img.draft("RGB", new_size)
+                attacked_img = _scale_down_up(img.convert("RGB"), new_size, original_size)
+                attack_chain = attack_chain[1:]
+            else:
+                attacked_img = img.convert("RGB")
+
+            # Apply each specified attack in sequence
+            attacked_img = _chain_runner(attack_chain)(attacked_img)
+
+            _save_result(attacked_img, filename, output_dir, **save_options)
+
+    except Exception as e:
+        print(f"Could not process {filename}. Reason: {e}")
+
+def _load_tensor(image_path: str) -> "torch.Tensor":
+    import torchvision.transforms.functional as TF
+    with Image.open(image_path) as img:
+        return TF.pil_to_tensor(img.convert("RGB"))
+
+def _write_tensor(attacked: "torch.Tensor", filename: str, output_dir: str, save_options):
+    import torchvision.transforms.functional as TF
+    try:
+        _save_result(TF.to_pil_image(attacked), filename, output_dir, **save_options)
+    except Exception as e:
+        print(f"Could not process {filename}. Reason: {e}")
+
+def _process_batched(image_files, input_folder, attack_chain, output_dir, save_options, device, batch_size,
+                     io_workers=4):
+    """Applies the attack chain to batches of same-sized images as tensor ops on `device`.
+
+    Decoding of the next batch and encoding of the previous one run on thread pools
+    while the current batch is being processed.
+    """
+    import torch
+    with ThreadPoolExecutor(max_workers=io_workers) as readers, ThreadPoolExecutor(max_workers=io_workers) as writers:
+        def read_batch(start):
+            return [(filename, readers.submit(_load_tensor, os.path.join(input_folder, filename)))
+                    for filename in image_files[start:start + batch_size]]
+
+        next_loads = read_batch(0)
+        pending_writes = []
+        for start in range(0, len(image_files), batch_size):
+            loads, next_loads = next_loads, read_batch(start + batch_size)
+
+            batches = defaultdict(list)
+            for filename, future in loads:
+                try:
+                    tensor = future.result()
+                    batches[tensor.shape].append((filename, tensor))
+                except Exception as e:
+                    print(f"Could not process {filename}. Reason: {e}")
+
+            results = []
+            for batch in batches.values():
+                filenames = [filename for filename, _ in batch]
+                try:
+                    x = _to_float(torch.stack([tensor for _, tensor in batch]).to(device))
+                    for func, strength in attack_chain:
+                        x = _TENSOR_ATTACKS[func](x, strength)
+                    results.extend(zip(filenames, _to_uint8(x)))
+                except Exception as e:
+                    print(f"Could not process {', '.join(filenames)}. Reason: {e}")
+
+            # Bound memory to roughly one batch of outstanding writes
+            wait(pending_writes)
+            pending_writes = [writers.submit(_write_tensor, attacked, filename, output_dir, save_options)
+                              for filename, attacked in results]
+
 def main():
     parser = argparse.ArgumentParser(
         description="Apply a sequential chain of attacks to images. Specify one or more attack flags to build the chain.",
@@ -98,6 +480,12 @@ def main():
     parser.add_argument("--blur_radius", type=float, default=None, help="Gaussian blur radius.")
     parser.add_argument("--noise_std", type=float, default=None, help="Standard deviation for Gaussian noise.")
     parser.add_argument("--jpeg_q", type=int, default=None, help="Final JPEG quality (0-100).")
+    parser.add_argument("--save_quality", type=int, default=100, help="JPEG quality of the saved results. Lower values (e.g. 95) save faster but add compression on top of the attack chain.")
+    parser.add_argument("--save_subsampling", type=int, default=2, choices=[0, 1, 2], help="Chroma subsampling of the saved results (0: 4:4:4, 1: 4:2:2, 2: 4:2:0). Use 0 for near-lossless output.")
+    parser.add_argument("--jpeg_draft", action="store_true", help="When the chain starts with scaling, decode JPEG inputs at reduced size (faster, but results differ from PNG inputs).")
+    parser.add_argument("--num_workers", type=int, default=os.cpu_count(), help="Number of worker processes.")
+    parser.add_argument("--device", type=str, default=None, help="Run the chain as batched tensor ops on this device (e.g. cuda) instead of PIL worker processes.")
+    parser.add_argument("--batch", type=int, default=32, help="Images per batch when --device is set.")
 
     args = parser.parse_args()
 
@@ -149,6 +537,14 @@ def main():
         print("No attacks specified. Please provide at least one attack flag (e.g., --rotation 45).")
         return
 
+    # Brightness, contrast and gamma are per-pixel remaps, so consecutive ones
+    # collapse into a single lookup table instead of one full pass each.
+    attack_chain = _fuse_steps(attack_chain, _TONE_ATTACKS, apply_tone_curve)
+    # Likewise, consecutive geometric transforms compose into one affine resample.
+    # Scaling is left out since its down-and-up resize is the attack itself, and
+    # cropping since it doesn't resample and later steps must not see the cut pixels.
+    attack_chain = _fuse_steps(attack_chain, _GEOMETRIC_ATTACKS, apply_affine)
+
     # --- Create the combined output directory ---
     base_output_dir = "attack_results_sequential"
     output_dir_name = "_".join(dir_name_parts)
@@ -158,23 +554,18 @@ def main():
     print(f"Output will be saved to: {final_output_dir}")
 
     # --- Process Images ---
+    save_options = {"quality": args.save_quality, "subsampling": args.save_subsampling}
     image_files = [f for f in os.listdir(args.input_folder) if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
-    for filename in image_files:
-        try:
-            image_path = os.path.join(args.input_folder, filename)
-            with Image.open(image_path) as img:
-                attacked_img = img.copy().convert("RGB")
-
-                # Apply each specified attack in sequence
-                for func, strength in attack_chain:
-                    attacked_img = func(attacked_img, strength)
-
-                output_filename = os.path.splitext(filename)[0] + '.jpg'
-                output_path = os.path.join(final_output_dir, output_filename)
-                attacked_img.save(output_path, "JPEG", quality=100) # Save final result at high quality
-
-        except Exception as e:
-            print(f"Could not process {filename}. Reason: {e}")
+    if args.device is not None:
+        _process_batched(image_files, args.input_folder, attack_chain, final_output_dir, save_options,
+                         args.device, args.batch)
+    else:
+        process_one = functools.partial(_process_one, input_folder=args.input_folder,
+                                        attack_chain=_compile_chain(attack_chain), output_dir=final_output_dir,
+                                        save_options=save_options, jpeg_draft=args.jpeg_draft)
+        with ProcessPoolExecutor(max_workers=args.num_workers, initializer=_init_worker,
+                                 initargs=(args.num_workers,)) as executor:
+            list(executor.map(process_one, image_files, chunksize=4))
     
     print("\nProcessing complete.")
 
@@ -197,4 +588,7 @@ if __name__ == "__main__":
     #
     # Example 4: A more complex chain of geometric and photometric attacks
     # python attacks.py my_watermarked_images --rotation -10 --scale_factor 0.7 --brightness 1.1 --noise_std 5
+    #
+    # Example 5: Run the same chain on the GPU in batches of 64 images
+    # python attacks.py my_watermarked_images --rotation -10 --scale_factor 0.7 --brightness 1.1 --noise_std 5 --device cuda --batch 64
     main()
\ No newline at end of file
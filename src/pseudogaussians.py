@@ -1,32 +1,34 @@
 import torch
-from scipy.special import erf
 from scipy.linalg import orth
 import numpy as np
 
 
-def sample(codeword, basis=None):
-    # pseudogaussian = codeword * torch.abs(torch.randn_like(codeword, dtype=torch.float64))
-    codeword_np = codeword.numpy()
-    pseudogaussian_np = codeword_np * np.abs(np.random.randn(*codeword_np.shape))
-    pseudogaussian = torch.from_numpy(pseudogaussian_np).to(dtype=torch.float64)
+def sample_batch(codewords, basis=None):
+    # codewords: (B, n) stack of PRC codewords, sampled with one set of kernel launches
+    # Magnitudes come from NumPy's RNG so seeded runs reproduce previously generated latents
+    magnitudes = torch.from_numpy(np.abs(np.random.randn(*codewords.shape))).to(codewords.device)
+    pseudogaussians = codewords.to(torch.float64) * magnitudes
     if basis is None:
-        return pseudogaussian
-    return pseudogaussian @ basis.T
+        return pseudogaussians
+    return pseudogaussians @ basis.T
+
+
+def sample(codeword, basis=None):
+    return sample_batch(codeword.unsqueeze(0), basis)[0]
 
 
 def recover_posteriors(z, basis=None, variances=None):
     if variances is None:
-        default_variance = 1.5
-        denominators = np.sqrt(2 * default_variance * (1+default_variance)) * torch.ones_like(z)
-    elif type(variances) is float:
-        denominators = np.sqrt(2 * variances * (1 + variances))
+        variances = 1.5
+    if type(variances) is float:
+        denominators = float(np.sqrt(2 * variances * (1 + variances)))
     else:
         denominators = torch.sqrt(2 * variances * (1 + variances))
 
     if basis is None:
-        return erf(z / denominators)
+        return torch.special.erf(z / denominators)
     else:
-        return erf((z @ basis) / denominators)
+        return torch.special.erf((z @ basis) / denominators)
 
 def random_basis(n):
     gaussian = torch.randn(n, n, dtype=torch.double)